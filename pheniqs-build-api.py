@@ -23,19 +23,15 @@
 import io
 import os
 import sys
-import json
+import shutil
 import signal
+import threading
 import logging
-import hashlib
-import platform
-from copy import deepcopy
 from datetime import datetime, date
-from subprocess import Popen, PIPE
+from functools import lru_cache
+from types import MappingProxyType
+from collections.abc import Mapping
 from argparse import ArgumentParser
-import urllib.request, urllib.parse, urllib.error
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
-from http.client import BadStatusLine
 
 log_levels = {
     'debug': logging.DEBUG,
@@ -44,7 +40,27 @@ log_levels = {
     'error': logging.ERROR,
     'critical': logging.CRITICAL
 }
-interface_configuration = {
+parameter_types = {
+    'int': int,
+    'float': float,
+    'str': str,
+    'bool': bool
+}
+download_buffer_size = 1048576
+cache_schema = 2
+tar_compression = [ 'gz', 'bz2', 'xz' ]
+url_pool = None
+document_encoder = None
+url_pool_lock = threading.Lock()
+def freeze(node):
+    if isinstance(node, dict):
+        return MappingProxyType({ k: freeze(v) for k,v in node.items() })
+    elif isinstance(node, list):
+        return tuple(freeze(v) for v in node)
+    else:
+        return node
+
+interface_configuration = freeze({
     "interface": {
         "argument": [
             "version",
@@ -91,6 +107,16 @@ interface_configuration = {
                     "metavar": "REVISION"
                 }
             },
+            "trust cache": {
+                "flag": [
+                    "--trust-cache"
+                ],
+                "parameter": {
+                    "action": "store_true",
+                    "dest": "trust cache",
+                    "help": "trust recorded archive checksums instead of verifying them again"
+                }
+            },
             "verbosity": {
                 "flag": [
                     "-v",
@@ -136,7 +162,8 @@ interface_configuration = {
                     "argument": [
                         "path",
                         "preset",
-                        "revision"
+                        "revision",
+                        "trust cache"
                     ],
                     "implementation": "build",
                     "instruction": {
@@ -189,6 +216,7 @@ interface_configuration = {
             "home": "bin",
             "package": [
                 {
+                    "depends on": [],
                     "make clean target": "distclean",
                     "name": "zlib",
                     "remote url": [
@@ -197,6 +225,7 @@ interface_configuration = {
                     "sha1": "e6d119755acdf9104d7ba236b1242696940ed6dd"
                 },
                 {
+                    "depends on": [],
                     "include prefix in make": True,
                     "name": "bz2",
                     "remote url": [
@@ -206,6 +235,7 @@ interface_configuration = {
                     "version": "1.0.8"
                 },
                 {
+                    "depends on": [],
                     "name": "xz",
                     "remote url": [
                         "https://downloads.sourceforge.net/project/lzmautils/xz-5.2.5.tar.bz2",
@@ -214,6 +244,7 @@ interface_configuration = {
                     "sha1": "19f83fb33dc51df87169864decd4b3de75dee1df"
                 },
                 {
+                    "depends on": [],
                     "make build optional": [
                         "CC=gcc"
                     ],
@@ -226,6 +257,12 @@ interface_configuration = {
                     "version": "1.7"
                 },
                 {
+                    "depends on": [
+                        "zlib",
+                        "bz2",
+                        "xz",
+                        "libdeflate"
+                    ],
                     "name": "htslib",
                     "remote url": [
                         "https://github.com/samtools/htslib/releases/download/1.13/htslib-1.13.tar.bz2"
@@ -233,6 +270,7 @@ interface_configuration = {
                     "sha1": "df9e67a204ffb9595482d736bd519733a3442554"
                 },
                 {
+                    "depends on": [],
                     "name": "rapidjson",
                     "remote filename": "rapidjson-1.1.0.tar.gz",
                     "remote url": "https://github.com/miloyip/rapidjson/archive/v1.1.0.tar.gz",
@@ -240,6 +278,14 @@ interface_configuration = {
                     "version": "1.1.0"
                 },
                 {
+                    "depends on": [
+                        "zlib",
+                        "bz2",
+                        "xz",
+                        "libdeflate",
+                        "htslib",
+                        "rapidjson"
+                    ],
                     "include prefix in make": True,
                     "make build optional": [
                         "PHENIQS_ZLIB_VERSION=1.2.11",
@@ -260,6 +306,7 @@ interface_configuration = {
             "home": "bin",
             "package": [
                 {
+                    "depends on": [],
                     "make clean target": "distclean",
                     "name": "zlib",
                     "remote url": [
@@ -268,6 +315,7 @@ interface_configuration = {
                     "sha1": "e6d119755acdf9104d7ba236b1242696940ed6dd"
                 },
                 {
+                    "depends on": [],
                     "include prefix in make": True,
                     "name": "bz2",
                     "remote url": [
@@ -280,6 +328,7 @@ interface_configuration = {
                     "configure optional": [
                         "--enable-static"
                     ],
+                    "depends on": [],
                     "name": "xz",
                     "remote url": [
                         "https://downloads.sourceforge.net/project/lzmautils/xz-5.2.5.tar.bz2",
@@ -288,6 +337,7 @@ interface_configuration = {
                     "sha1": "19f83fb33dc51df87169864decd4b3de75dee1df"
                 },
                 {
+                    "depends on": [],
                     "make build optional": [
                         "CC=gcc"
                     ],
@@ -303,6 +353,12 @@ interface_configuration = {
                     "configure optional": [
                         "--disable-libcurl"
                     ],
+                    "depends on": [
+                        "zlib",
+                        "bz2",
+                        "xz",
+                        "libdeflate"
+                    ],
                     "name": "htslib",
                     "remote url": [
                         "https://github.com/samtools/htslib/releases/download/1.13/htslib-1.13.tar.bz2"
@@ -310,6 +366,7 @@ interface_configuration = {
                     "sha1": "df9e67a204ffb9595482d736bd519733a3442554"
                 },
                 {
+                    "depends on": [],
                     "name": "rapidjson",
                     "remote filename": "rapidjson-1.1.0.tar.gz",
                     "remote url": [
@@ -319,6 +376,14 @@ interface_configuration = {
                     "version": "1.1.0"
                 },
                 {
+                    "depends on": [
+                        "zlib",
+                        "bz2",
+                        "xz",
+                        "libdeflate",
+                        "htslib",
+                        "rapidjson"
+                    ],
                     "include prefix in make": True,
                     "make build optional": [
                         "with-static=1",
@@ -337,7 +402,7 @@ interface_configuration = {
             ]
         }
     }
-}
+})
 
 def termination_handler(signal, frame):
     sys.exit(0)
@@ -345,49 +410,78 @@ signal.signal(signal.SIGTERM, termination_handler)
 signal.signal(signal.SIGINT, termination_handler)
 
 def to_json(ontology):
+    import json
+
     return json.dumps(ontology, sort_keys=True, ensure_ascii=False, indent=4)
 
+def clone_json(node):
+    # the ontology only holds json like data, so a plain recursive copy
+    # of dict and list is enough and much cheaper than deepcopy.
+    # frozen mappings and tuples come back as mutable dict and list.
+    if isinstance(node, Mapping):
+        return { k: clone_json(v) for k,v in node.items() }
+    elif isinstance(node, (list, tuple)):
+        return [ clone_json(v) for v in node ]
+    else:
+        return node
+
 def merge(this, other):
     if this is None:
-        return deepcopy(other)
+        return clone_json(other)
     else:
         # this is not None
         if other is None:
-            return deepcopy(this)
+            return clone_json(this)
         else:
             # other is not None
-            if isinstance(this, dict):
-                if isinstance(other, dict):
+            if isinstance(this, Mapping):
+                if isinstance(other, Mapping):
                     merged = dict()
                     for k,v in this.items():
                         if k not in other:
-                            merged[k] = deepcopy(this[k])
+                            merged[k] = clone_json(this[k])
                     for k,v in other.items():
                         if k not in this:
-                            merged[k] = deepcopy(v)
+                            merged[k] = clone_json(v)
                         else:
                             merged[k] = merge(this[k], v)
                     return merged
                 else:
                     raise ValueError('incompatible structure')
             else:
-                return deepcopy(other)
+                return clone_json(other)
 
 def remove_directory(directory, log):
     if os.path.exists(directory):
         log.info('removing {}'.format(directory))
-        command = [ 'rm', '-rf' ]
-        command.append(directory)
-        process = Popen(
-            args=command,
-            stdout=PIPE,
-            stderr=PIPE
-        )
-        output, error = process.communicate()
-        code = process.returncode
-        if code != 0:
-            print(output, error, code)
-            raise CommandFailedError('failed to remove directory {}'.format(directory))
+        try:
+            shutil.rmtree(directory)
+        except OSError as e:
+            raise CommandFailedError('failed to remove directory {}: {}'.format(directory, e))
+
+def copy_file(source, destination, log):
+    log.debug('copying {} to {}'.format(source, destination))
+    try:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy2(source, destination)
+    except OSError as e:
+        raise CommandFailedError('failed to copy {}: {}'.format(source, e))
+
+def copy_directory(source, destination, log):
+    log.debug('copying {} to {}'.format(source, destination))
+    try:
+        shutil.copytree(source, destination, dirs_exist_ok=True)
+    except OSError as e:
+        raise CommandFailedError('failed to copy {}: {}'.format(source, e))
+
+@lru_cache(maxsize=None)
+def expand_path(path, resolve=False):
+    # abspath only normalizes the string, realpath stats every component to resolve symlinks
+    path = os.path.expanduser(os.path.expandvars(path))
+    if resolve:
+        return os.path.realpath(path)
+    else:
+        return os.path.abspath(path)
 
 def prepare_path(path, log, overwrite=True):
     def check_permission(path):
@@ -438,6 +532,130 @@ def prepare_directory(directory, log):
        log.debug('creating directory %s', directory)
        os.makedirs(directory)
 
+def update_digest(digest, path):
+    with open(path, 'rb') as file:
+        while True:
+            buffer = file.read(download_buffer_size)
+            if not buffer:
+                break
+            digest.update(buffer)
+    return digest
+
+def file_sha1(path):
+    import hashlib
+    return update_digest(hashlib.sha1(), path).hexdigest()
+
+def fast_digest(content):
+    import hashlib
+    # digest used only to key local documents,
+    # archive integrity is still checked against the published sha1
+    return hashlib.blake2b(content.encode('utf8'), digest_size=20).hexdigest()
+
+def document_digest(node):
+    # one sorted encoder is reused for every document, json is only imported once a document is keyed
+    global document_encoder
+    if document_encoder is None:
+        import json
+        document_encoder = json.JSONEncoder(sort_keys=True, ensure_ascii=False)
+    return fast_digest(document_encoder.encode(node))
+
+def extract_tar(archive, directory):
+    import tarfile
+    if hasattr(tarfile, 'data_filter'):
+        archive.extractall(directory, filter='data')
+    else:
+        def checked(archive):
+            root = os.path.realpath(directory)
+            for member in archive:
+                target = os.path.realpath(os.path.join(root, member.name))
+                if os.path.commonpath([ root, target ]) != root:
+                    raise CommandFailedError('refusing to extract {} outside {}'.format(member.name, directory))
+                if member.issym() or member.islnk():
+                    if member.issym():
+                        link = os.path.realpath(os.path.join(os.path.dirname(target), member.linkname))
+                    else:
+                        link = os.path.realpath(os.path.join(root, member.linkname))
+                    if os.path.commonpath([ root, link ]) != root:
+                        raise CommandFailedError('refusing to extract link {} outside {}'.format(member.name, directory))
+                yield member
+        archive.extractall(directory, members=checked(archive))
+
+def move_tree(source, directory):
+    # move every top level entry of a staging directory into place, replacing what was there
+    for name in os.listdir(source):
+        target = os.path.join(directory, name)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        os.replace(os.path.join(source, name), target)
+
+def extract_zip(archive, directory):
+    # zipfile already strips absolute and parent components from member names
+    # but does not restore permissions the way unzip does
+    for member in archive.infolist():
+        path = archive.extract(member, directory)
+        mode = (member.external_attr >> 16) & 0o777
+        if mode:
+            os.chmod(path, mode)
+
+def connection_pool():
+    # urllib3 is optional, when available all downloads share one pool of keep alive connections
+    global url_pool
+    with url_pool_lock:
+        if url_pool is None:
+            try:
+                import urllib3
+            except ImportError:
+                url_pool = False
+            else:
+                url_pool = urllib3.PoolManager(maxsize=8, retries=urllib3.Retry(3, backoff_factor=0.3))
+    return url_pool or None
+
+def open_url(url, headers=None):
+    from urllib.error import URLError, HTTPError
+
+    pool = None
+    if url.startswith('http://') or url.startswith('https://'):
+        pool = connection_pool()
+
+    if pool is not None:
+        import urllib3
+        try:
+            response = pool.request('GET', url, headers=headers, preload_content=False, decode_content=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise URLError(getattr(e, 'reason', None) or e)
+        if response.status >= 400:
+            response.release_conn()
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        return response
+    else:
+        from urllib.request import Request, urlopen
+        return urlopen(Request(url, None, headers or {}))
+
+def response_errors():
+    # errors raised while reading a response body, after open_url returned
+    from http.client import HTTPException
+
+    errors = [ HTTPException, OSError ]
+    if connection_pool() is not None:
+        import urllib3
+        errors.append(urllib3.exceptions.HTTPError)
+    return tuple(errors)
+
+def release_url(response):
+    if hasattr(response, 'release_conn'):
+        # return the connection to the pool rather than closing it
+        response.release_conn()
+    else:
+        response.close()
+
+def parameter_type(name):
+    if name in parameter_types:
+        return parameter_types[name]
+    else:
+        raise ValueError('unknown parameter type {}'.format(name))
+
 def split_class(name):
     return (name[0:name.rfind('.')], name[name.rfind('.') + 1:])
 
@@ -449,6 +667,39 @@ class CommandFailedError(Exception):
     def __init__(self, message):
         super(Exception, self).__init__(message)
 
+class ArchiveStream(object):
+    # read only file object over a download that saves and hashes whatever is read through it
+    def __init__(self, response, local, digest=None):
+        import hashlib
+        self.response = response
+        self.local = local
+        self.digest = digest if digest is not None else hashlib.sha1()
+        self.errors = response_errors()
+        self.error = None
+        self.size = 0
+
+    def read(self, size=-1):
+        # a broken connection ends the stream early and is reported through error
+        if self.error is not None:
+            return b''
+        try:
+            buffer = self.response.read(size if size is not None and size >= 0 else download_buffer_size)
+        except self.errors as e:
+            self.error = e
+            return b''
+        if buffer:
+            self.size += len(buffer)
+            self.digest.update(buffer)
+            self.local.write(buffer)
+        return buffer
+
+    def drain(self):
+        while self.read(download_buffer_size):
+            pass
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
 class CommandLineParser(object):
     def __init__(self, name):
         self.ontology = {
@@ -460,39 +711,32 @@ class CommandLineParser(object):
         self.load()
 
     def load(self):
-        self.ontology = merge(self.ontology, interface_configuration)
+        # interface_configuration is frozen so the ontology can share it without copying
+        for k,v in interface_configuration.items():
+            self.ontology[k] = v
         self.parser = ArgumentParser(**self.interface['instruction'])
 
         # evaluate the type for each prototype
-        for prototype in self.interface['prototype'].values():
-            if 'type' in prototype['parameter']:
-                prototype['parameter']['type'] = eval(prototype['parameter']['type'])
+        prototype = self.evaluate(self.interface['prototype'])
 
         # add global arguments
         for argument in self.interface['argument']:
-            prototype = self.interface['prototype'][argument]
-
             # See https://docs.python.org/3/library/argparse.html?highlight=add_argument#argparse.ArgumentParser.add_argument
-            self.parser.add_argument(*prototype['flag'], **prototype['parameter'])
+            self.parser.add_argument(*prototype[argument]['flag'], **prototype[argument]['parameter'])
 
         if self.sectioned:
             # Add individual command sections
             sub = self.parser.add_subparsers(**self.interface['section']['instruction'])
             for action in self.interface['section']['action']:
                 if 'prototype' in action:
-                    for prototype in action['prototype'].values():
-                        if 'type' in prototype['parameter']:
-                            prototype['parameter']['type'] = eval(prototype['parameter']['type'])
-                    action['prototype'] = merge(self.interface['prototype'], action['prototype'])
+                    action_prototype = merge(prototype, self.evaluate(action['prototype']))
                 else:
-                    action['prototype'] = deepcopy(self.interface['prototype'])
+                    action_prototype = prototype
 
-                key = action['instruction']['name']
                 action_parser = sub.add_parser(**action['instruction'])
                 if 'argument' in action:
                     for argument in action['argument']:
-                        prototype = action['prototype'][argument]
-                        action_parser.add_argument(*prototype['flag'], **prototype['parameter'])
+                        action_parser.add_argument(*action_prototype[argument]['flag'], **action_prototype[argument]['parameter'])
 
                 # Add groups of arguments, if any.
                 if 'group' in action:
@@ -500,13 +744,21 @@ class CommandLineParser(object):
                         group_parser = action_parser.add_argument_group(**group['instruction'])
                         if 'argument' in group:
                             for argument in group['argument']:
-                                prototype = action['prototype'][argument]
-                                group_parser.add_argument(*prototype['flag'], **prototype['parameter'])
+                                group_parser.add_argument(*action_prototype[argument]['flag'], **action_prototype[argument]['parameter'])
 
         for k,v in vars(self.parser.parse_args()).items():
             if v is not None:
                 self.ontology['instruction'][k] = v
 
+    def evaluate(self, prototypes):
+        evaluated = {}
+        for name, prototype in prototypes.items():
+            parameter = dict(prototype['parameter'])
+            if 'type' in parameter:
+                parameter['type'] = parameter_type(parameter['type'])
+            evaluated[name] = { 'flag': prototype['flag'], 'parameter': parameter }
+        return evaluated
+
     @property
     def help_triggered(self):
         return self.sectioned and self.action is None
@@ -525,9 +777,7 @@ class CommandLineParser(object):
 
     @property
     def configuration(self):
-        configuration = deepcopy(self.ontology)
-        del configuration['interface']
-        return configuration
+        return { k: clone_json(v) for k,v in self.ontology.items() if k != 'interface' }
 
     @property
     def action(self):
@@ -540,6 +790,8 @@ class Package(object):
     def __init__(self, pipeline, node):
         self.log = logging.getLogger('Package')
         self.pipeline = pipeline
+        self.install_lock = threading.Lock()
+        self.environment = None
         for key in [
             'sha1',
             'version',
@@ -552,7 +804,7 @@ class Package(object):
             'compression',
             'display name',
             'path in archive',
-            'document sha1 digest',
+            'document digest',
         ]:
             if key not in node:
                 node[key] = None
@@ -600,19 +852,22 @@ class Package(object):
             'download url'
         ]:
             if node[url] is not None:
-                node[url] = os.path.abspath(os.path.expanduser(os.path.expandvars(node[url])))
+                node[url] = expand_path(node[url])
 
-        content = json.dumps(node, sort_keys=True, ensure_ascii=False)
-        node['document sha1 digest'] = hashlib.sha1(content.encode('utf8')).hexdigest()
+        # the digest keys the persisted cache so it must be stable across runs,
+        # which rules out the salted builtin hash. compute it once and look it up once.
+        digest = document_digest(node)
+        node['document digest'] = digest
 
-        if node['document sha1 digest'] not in self.pipeline.persisted_instruction['package']:
+        persisted = self.pipeline.persisted_instruction['package']
+        if digest not in persisted:
             node['unpacked'] = False
             node['configured'] = False
             node['built'] = False
             node['installed'] = False
-            self.pipeline.persisted_instruction['package'][node['document sha1 digest']] = node
+            persisted[digest] = node
 
-        self.node = self.pipeline.persisted_instruction['package'][node['document sha1 digest']]
+        self.node = persisted[digest]
 
     @classmethod
     def create(cls, pipeline, ontology):
@@ -639,9 +894,10 @@ class Package(object):
 
     @property
     def env(self):
-        if 'env' not in self.node or self.node['env'] is None:
-            self.node['env'] = os.environ.copy()
-        return self.node['env']
+        # built from the caller's environment on every run and never persisted with the node
+        if self.environment is None:
+            self.environment = os.environ.copy()
+        return self.environment
 
     @property
     def platform(self):
@@ -651,6 +907,12 @@ class Package(object):
     def name(self):
         return self.node['name']
 
+    @property
+    def depends_on(self):
+        if 'depends on' in self.node:
+            return self.node['depends on']
+        return None
+
     @property
     def unpacked(self):
         return self.node['unpacked']
@@ -735,61 +997,211 @@ class Package(object):
     def sha1(self):
         return self.node['sha1']
 
-    def download(self):
-        if self.download_url is not None:
-            content = None
-            if self.sha1 is None:
-                if os.path.exists(self.download_url):
-                    self.log.debug('removing old real time archive %s', self.download_url)
-                    os.remove(self.download_url)
-
-            if os.path.exists(self.download_url):
-                with open(self.download_url, 'rb') as local:
-                    content = local.read()
-                    checksum = hashlib.sha1(content).hexdigest()
-                    if self.sha1 is not None and checksum != self.sha1:
-                        self.log.warning('removing corrupt archive %s', self.download_url)
-                        os.remove(self.download_url)
-                        content = None
-
-            if content is None:
-                remote_url = self.remote_url
-                if not isinstance(self.remote_url, list):
-                    remote_url = [ self.remote_url ]
-
-
-                error = None
-                success = False
-                for url in remote_url:
-                    self.log.debug('fetching %s', url)
-                    request = Request(url, None)
+    @property
+    def partial_url(self):
+        return '{}.part'.format(self.download_url)
+
+    @property
+    def checksum_cache_url(self):
+        return '{}.sha1cache'.format(self.download_url)
+
+    @property
+    def checksum_cached(self):
+        import json
+
+        sha1 = self.sha1
+        checksum_cache_url = self.checksum_cache_url
+        if sha1 is not None and os.path.exists(checksum_cache_url):
+            try:
+                with io.open(checksum_cache_url, 'rb') as file:
+                    record = json.load(file)
+            except (OSError, ValueError):
+                return False
+            status = os.stat(self.download_url)
+            return (
+                record.get('sha1') == sha1 and
+                record.get('size') == status.st_size and
+                record.get('mtime_ns') == status.st_mtime_ns
+            )
+        return False
+
+    def save_checksum_cache(self):
+        import json
+
+        if self.sha1 is not None:
+            status = os.stat(self.download_url)
+            record = { 'sha1': self.sha1, 'size': status.st_size, 'mtime_ns': status.st_mtime_ns }
+            with io.open(self.checksum_cache_url, 'wb') as file:
+                file.write(json.dumps(record, sort_keys=True).encode('utf8'))
+
+    def remove_checksum_cache(self):
+        if os.path.exists(self.checksum_cache_url):
+            os.remove(self.checksum_cache_url)
+
+    def verify_archive(self):
+        download_url = self.download_url
+        sha1 = self.sha1
+        present = False
+        if sha1 is None:
+            if os.path.exists(download_url):
+                self.log.debug('removing old real time archive %s', download_url)
+                os.remove(download_url)
+            self.remove_checksum_cache()
+
+        if os.path.exists(download_url):
+            present = True
+            if sha1 is not None:
+                if self.pipeline.trust_cache and self.checksum_cached:
+                    self.log.debug('trusting cached checksum for %s', download_url)
+                else:
+                    checksum = file_sha1(download_url)
+                    if checksum != sha1:
+                        self.log.warning('removing corrupt archive %s', download_url)
+                        os.remove(download_url)
+                        self.remove_checksum_cache()
+                        present = False
+                    else:
+                        self.save_checksum_cache()
+        return present
+
+    def fetch(self, extract=False):
+        import re
+        import hashlib
+        import tarfile
+        import tempfile
+        from urllib.error import URLError, HTTPError
+        from http.client import BadStatusLine
+
+        download_url = self.download_url
+        partial_url = self.partial_url
+        sha1 = self.sha1
+        remote_url = self.remote_url
+        if not isinstance(remote_url, list):
+            remote_url = [ remote_url ]
+
+        prepare_path(download_url, self.log)
+        error = None
+        for url in remote_url:
+            # a partial archive left by an interrupted download is resumed with a range request.
+            # real time archives have no checksum to validate the joined result so they always restart.
+            offset = 0
+            if not extract and sha1 is not None and os.path.exists(partial_url):
+                offset = os.path.getsize(partial_url)
+
+            self.log.debug('fetching %s', url)
+            try:
+                try:
+                    response = open_url(url, { 'Range': 'bytes={}-'.format(offset) } if offset else None)
+                except HTTPError as e:
+                    if offset and e.code == 416:
+                        offset = 0
+                        response = open_url(url)
+                    else:
+                        raise
+
+                if offset:
+                    content_range = response.headers.get('Content-Range') or ''
+                    if response.status != 206:
+                        self.log.debug('%s ignored the range request, restarting', url)
+                        offset = 0
+                    elif not content_range.startswith('bytes {}-'.format(offset)):
+                        release_url(response)
+                        offset = 0
+                        response = open_url(url)
+
+            except BadStatusLine as e:
+                error = 'Bad http status error when requesting {}'.format(url)
+                self.log.warning(error)
+            except HTTPError as e:
+                error = 'Server returned an error when requesting {}: {}'.format(url, e.code)
+                self.log.warning(error)
+            except URLError as e:
+                error = 'Could not reach server when requesting {}: {}'.format(url, e.reason)
+                self.log.warning(error)
+            else:
+                failure = None
+                staging = None
+                try:
                     try:
-                        response = urlopen(request)
-                    except BadStatusLine as e:
-                        error = 'Bad http status error when requesting {}'.format(url)
-                        self.log.warning(error)
-                    except HTTPError as e:
-                        error = 'Server returned an error when requesting {}: {}'.format(url, e.code)
+                        if offset:
+                            self.log.debug('resuming %s download at byte %d', self.display_name, offset)
+                            digest = update_digest(hashlib.sha1(), partial_url)
+                            local = open(partial_url, 'ab')
+                        else:
+                            digest = hashlib.sha1()
+                            local = open(partial_url, 'wb')
+
+                        with local:
+                            stream = ArchiveStream(response, local, digest)
+                            if extract:
+                                # members land in a staging directory and only move into place once the checksum matches
+                                staging = tempfile.mkdtemp(prefix='.unpack-', dir=self.package_prefix)
+                                try:
+                                    with tarfile.open(fileobj=stream, mode='r|{}'.format(self.compression)) as archive:
+                                        extract_tar(archive, staging)
+                                except (tarfile.TarError, EOFError, OSError) as e:
+                                    failure = e
+                            stream.drain()
+                    finally:
+                        release_url(response)
+
+                    # urllib returns a short body without raising when the connection drops
+                    length = response.headers.get('Content-Length') or ''
+                    if not length.isdigit() and offset:
+                        span = re.match(r'bytes (\d+)-(\d+)/', response.headers.get('Content-Range') or '')
+                        if span:
+                            length = str(int(span.group(2)) - int(span.group(1)) + 1)
+                    if stream.error is None and length.isdigit() and stream.size < int(length):
+                        stream.error = 'body ended after {} of {} bytes'.format(stream.size, length)
+
+                    checksum = stream.hexdigest()
+                    if stream.error is not None:
+                        # keep what arrived so the next mirror or a later run can resume it
+                        error = 'Connection broke when requesting {}: {}'.format(url, stream.error)
                         self.log.warning(error)
-                    except URLError as e:
-                        error = 'Could not reach server when requesting {}: {}'.format(url, e.reason)
+                        if sha1 is not None:
+                            extract = False
+                    elif sha1 is not None and checksum != sha1:
+                        os.unlink(partial_url)
+                        error = '{} checksum {} differs from {}'.format(self.display_name, checksum, sha1)
                         self.log.warning(error)
+                    elif failure is not None:
+                        os.replace(partial_url, download_url)
+                        self.save_checksum_cache()
+                        raise CommandFailedError('failed to unpack {}: {}'.format(self.display_name, failure))
                     else:
-                        content = response.read()
-                        checksum = hashlib.sha1(content).hexdigest()
-                        if self.sha1 is not None and checksum != self.sha1:
-                            error = '{} checksum {} differs from {}'.format(self.display_name, checksum, self.sha1)
-                            self.log.warning(error)
-                        else:
-                            prepare_path(self.download_url, self.log)
-                            with open(self.download_url, 'wb') as local:
-                                local.write(content)
-                            self.log.info('downloaded archive saved %s %s', self.display_name, self.sha1)
-                            success = True
-                            break
+                        if staging is not None:
+                            move_tree(staging, self.package_prefix)
+                        os.replace(partial_url, download_url)
+                        self.save_checksum_cache()
+                        return extract
+                finally:
+                    if staging is not None:
+                        shutil.rmtree(staging, ignore_errors=True)
+
+        raise DownloadError(error)
+
+    @property
+    def archive_key(self):
+        return (self.sha1, self.download_url)
+
+    @property
+    def downloaded(self):
+        return self.pipeline.archive_downloaded(self.archive_key)
 
-                if not success:
-                    raise DownloadError(error)
+    def set_downloaded(self):
+        self.pipeline.set_archive_downloaded(self.archive_key)
+
+    def download(self):
+        fetched = False
+        if self.download_url is not None:
+            with self.pipeline.archive_lock(self.download_url):
+                if not self.downloaded:
+                    if not self.verify_archive():
+                        self.fetch()
+                        fetched = True
+                    self.set_downloaded()
+        return fetched
 
     def clean_package(self):
         if self.download_url is not None:
@@ -804,47 +1216,73 @@ class Package(object):
         self.node['built'] = False
         self.node['installed'] = False
 
+    def unpack_stream(self):
+        streamed = self.fetch(extract=True)
+        self.set_downloaded()
+        if streamed:
+            self.node['unpacked'] = True
+        return streamed
+
+    def extract(self):
+        import tarfile
+        import zipfile
+
+        status = 'unpacked'
+        if self.downloaded or self.verify_archive():
+            self.set_downloaded()
+
+        elif self.compression in tar_compression and not os.path.exists(self.partial_url):
+            # nothing cached, extract while downloading
+            if self.unpack_stream():
+                return 'streamed'
+            # a broken stream was resumed into the archive instead
+            status = 'downloaded'
+
+        elif self.download():
+            status = 'downloaded'
+
+        try:
+            if self.compression in tar_compression:
+                with tarfile.open(self.download_url, mode='r:{}'.format(self.compression)) as archive:
+                    extract_tar(archive, self.package_prefix)
+
+            elif self.compression in [ 'zip' ]:
+                with zipfile.ZipFile(self.download_url) as archive:
+                    extract_zip(archive, self.package_prefix)
+
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+            raise CommandFailedError('failed to unpack {}: {}'.format(self.display_name, e))
+
+        self.node['unpacked'] = True
+        return status
+
     def unpack(self):
+        # returns what was done so the caller can report it from the main thread
+        status = None
         if not self.node['unpacked']:
-            self.clean_package()
             if self.download_url is not None:
-                self.download()
-
-                self.log.info('unpacking %s', self.display_name)
-                command = []
-                if self.compression in [ 'gz', 'bz2']:
-                    command.append('tar')
-                    command.append('-x')
-                    if self.compression == 'gz':
-                        command.append('-z')
-                    elif self.compression == 'bz2':
-                        command.append('-j')
-                    command.append('-f')
-                    command.append(self.download_url)
-
-                elif self.compression in [ 'zip' ]:
-                    command.append('unzip')
-                    command.append('-x')
-                    command.append(self.download_url)
+                # packages sharing an archive take turns so it is fetched, verified and extracted once
+                with self.pipeline.archive_lock(self.download_url):
+                    if self.pipeline.archive_extracted(self.archive_key):
+                        self.node['unpacked'] = True
+                    else:
+                        self.clean_package()
+                        status = self.extract()
+                        self.pipeline.set_archive_extracted(self.archive_key)
+        return status
 
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_prefix,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.node['unpacked'] = True
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('tar returned {}'.format(code))
+    def run(self, command, name):
+        import subprocess
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(' '.join([str(i) for i in command]))
+
+        process = subprocess.run(command, env=self.env, cwd=self.package_url, stdout=self.stdout, stderr=self.stderr)
+        if process.returncode != 0:
+            marker = '--- failed command: {} returned {} ---\n'.format(' '.join([str(i) for i in command]), process.returncode).encode('utf8')
+            self.stdout.write(marker)
+            self.stderr.write(marker)
+            raise CommandFailedError('{} returned {}, output is in {}'.format(name, process.returncode, self.stderr.name))
 
     def configure(self):
         if not self.node['configured']:
@@ -881,8 +1319,18 @@ class Make(Package):
         if 'include prefix in make' not in self.node:
             self.node['include prefix in make'] = False
 
+        if 'make jobs' not in self.node:
+            self.node['make jobs'] = None
+
+        if 'make serial' not in self.node:
+            self.node['make serial'] = False
+
+        if 'make single pass' not in self.node:
+            self.node['make single pass'] = True
+
         self.env['CFLAGS'] = '-I{}'.format(self.include_prefix)
         self.env['LDFLAGS'] = '-L{}'.format(self.lib_prefix)
+        self.prefix_argument = 'PREFIX={}'.format(self.install_prefix)
 
     @property
     def configure_optional(self):
@@ -908,37 +1356,36 @@ class Make(Package):
     def include_prefix_in_make(self):
         return self.node['include prefix in make']
 
+    @property
+    def make_single_pass(self):
+        return self.node['make single pass']
+
+    @property
+    def make_jobs(self):
+        if self.node['make serial']:
+            return 1
+        elif self.node['make jobs']:
+            return self.node['make jobs']
+        else:
+            return self.pipeline.job_budget
+
     def clean(self):
         if self.package_url is not None:
-            if os.path.exists(os.path.join(self.package_url, 'Makefile')) and self.make_clean_target:
+            if (
+                (self.node['configured'] or self.node['built'] or self.node['installed']) and
+                self.make_clean_target and
+                os.path.exists(os.path.join(self.package_url, 'Makefile'))
+            ):
                 self.log.info('cleaning make environment %s', self.display_name)
                 command = [ 'make', self.make_clean_target ]
 
                 if self.include_prefix_in_make:
-                    command.append('PREFIX={}'.format(self.install_prefix))
-
-                self.log.debug(' '.join([str(i) for i in command]))
+                    command.append(self.prefix_argument)
 
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.node['configured'] = False
-                    self.node['built'] = False
-                    self.node['installed'] = False
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('make clean returned {}'.format(code))
+                self.run(command, 'make clean')
+                self.node['configured'] = False
+                self.node['built'] = False
+                self.node['installed'] = False
             else:
                 self.node['configured'] = False
                 self.node['built'] = False
@@ -955,26 +1402,8 @@ class Make(Package):
                     if self.configure_optional:
                         command.extend(self.configure_optional)
 
-                    self.log.debug(' '.join([str(i) for i in command]))
-
-                    process = Popen(
-                        args=command,
-                        env=self.env,
-                        cwd=self.package_url,
-                        stdout=PIPE,
-                        stderr=PIPE
-                    )
-                    output, error = process.communicate()
-                    code = process.returncode
-                    if code == 0:
-                        self.node['configured'] = True
-                        self.stdout.write(output.decode('utf8'))
-                        self.stderr.write(error.decode('utf8'))
-                    else:
-                        print(code)
-                        print(output.decode('utf8'))
-                        print(error.decode('utf8'))
-                        raise CommandFailedError('configure returned {}'.format(code))
+                    self.run(command, 'configure')
+                    self.node['configured'] = True
                 else:
                     self.node['configured'] = True
 
@@ -985,73 +1414,68 @@ class Make(Package):
                 self.log.info('building with make %s', self.display_name)
                 command = [ 'make' ]
 
+                if self.make_jobs > 1:
+                    command.append('-j{}'.format(self.make_jobs))
+
                 if self.make_build_target:
                     command.append(self.make_build_target)
 
                 if self.include_prefix_in_make:
-                    command.append('PREFIX={}'.format(self.install_prefix))
+                    command.append(self.prefix_argument)
 
                 if self.make_build_optional:
                     command.extend(self.make_build_optional)
 
-                self.log.debug(' '.join([str(i) for i in command]))
-
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.node['built'] = True
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('make returned {}'.format(code))
+                self.run(command, 'make')
+                self.node['built'] = True
 
     def install(self):
         if not self.node['installed']:
+            if (
+                self.make_single_pass and
+                self.make_build_target and
+                self.make_jobs == 1 and
+                not self.node['built'] and
+                self.package_url is not None
+            ):
+                # build and install goals in one make run so the makefile is only read once.
+                # with -j make updates command line goals concurrently and nothing guarantees
+                # the install recipes depend on the build, and without a named build target
+                # the default goal can not be requested alongside install.
+                self.configure()
+                self.log.info('building and installing with make %s', self.display_name)
+                command = [ 'make', self.make_build_target, self.make_install_target ]
+
+                if self.include_prefix_in_make:
+                    command.append(self.prefix_argument)
+
+                if self.make_build_optional:
+                    command.extend(self.make_build_optional)
+
+                self.run(command, 'make install')
+                self.node['built'] = True
+                self.node['installed'] = True
+                return
+
             self.build()
             if self.package_url is not None:
                 self.log.info('installing with make %s', self.display_name)
                 command = [ 'make' , self.make_install_target ]
 
                 if self.include_prefix_in_make:
-                    command.append('PREFIX={}'.format(self.install_prefix))
+                    command.append(self.prefix_argument)
 
                 if self.make_build_optional:
                     command.extend(self.make_build_optional)
 
-                self.log.debug(' '.join([str(i) for i in command]))
-
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.node['installed'] = True
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('make install returned {}'.format(code))
+                self.run(command, 'make install')
+                self.node['installed'] = True
 
 class BZip2(Make):
     def __init__(self, pipeline, node):
         Make.__init__(self, pipeline, node)
+        # the shared library is built and copied between the make build and install runs
+        self.node['make single pass'] = False
 
     def install_dynamic(self):
         so_basename = 'libbz2.so'
@@ -1059,35 +1483,23 @@ class BZip2(Make):
         full_versioned_so_package_path = os.path.join(self.package_url, full_versioned_so_basename)
         full_versioned_so_install_path = os.path.join(self.lib_prefix, full_versioned_so_basename)
 
-        self.log.debug('copying %s to %s', full_versioned_so_package_path, full_versioned_so_install_path)
-        command = [ 'rsync', '--copy-links', full_versioned_so_package_path, full_versioned_so_install_path ]
-        process = Popen(
-            args=command,
-            env=self.env,
-            cwd=self.package_url,
-            stdout=PIPE,
-            stderr=PIPE
-        )
-        output, error = process.communicate()
-        code = process.returncode
-        if code == 0:
-            self.stdout.write(output.decode('utf8'))
-            self.stderr.write(error.decode('utf8'))
-        else:
-            print(code)
-            print(output.decode('utf8'))
-            print(error.decode('utf8'))
-            raise CommandFailedError('rsync returned {}'.format(code))
+        copy_file(full_versioned_so_package_path, full_versioned_so_install_path, self.log)
 
         split_version = self.version.split('.')
-        while(len(split_version) > 1):
-            split_version = split_version[:-1]
-            partial_version = '.'.join(split_version)
-            partial_versioned_so_basename = '{}.{}'.format(so_basename, partial_version)
+        for length in range(len(split_version) - 1, 0, -1):
+            partial_versioned_so_basename = '{}.{}'.format(so_basename, '.'.join(split_version[:length]))
             partial_versioned_so_install_path = os.path.join(self.lib_prefix, partial_versioned_so_basename)
 
             self.log.info('symlinking %s to %s', full_versioned_so_basename, partial_versioned_so_install_path)
-            os.symlink(full_versioned_so_basename, partial_versioned_so_install_path)
+            try:
+                os.symlink(full_versioned_so_basename, partial_versioned_so_install_path)
+            except FileExistsError:
+                # left by an earlier install, swap in a fresh link atomically
+                temporary = '{}.tmp'.format(partial_versioned_so_install_path)
+                if os.path.lexists(temporary):
+                    os.remove(temporary)
+                os.symlink(full_versioned_so_basename, temporary)
+                os.replace(temporary, partial_versioned_so_install_path)
 
     def build(self):
         if self.platform == 'Linux':
@@ -1098,29 +1510,11 @@ class BZip2(Make):
                     command = [ 'make', '--file', 'Makefile-libbz2_so' ]
 
                     if self.include_prefix_in_make:
-                        command.append('PREFIX={}'.format(self.install_prefix))
-
-                    self.log.debug(' '.join([str(i) for i in command]))
-
-                    process = Popen(
-                        args=command,
-                        env=self.env,
-                        cwd=self.package_url,
-                        stdout=PIPE,
-                        stderr=PIPE
-                    )
-                    output, error = process.communicate()
-                    code = process.returncode
-                    if code == 0:
-                        self.stdout.write(output.decode('utf8'))
-                        self.stderr.write(error.decode('utf8'))
-                        self.install_dynamic()
-                        Make.build(self)
-                    else:
-                        print(code)
-                        print(output.decode('utf8'))
-                        print(error.decode('utf8'))
-                        raise CommandFailedError('make returned {}'.format(code))
+                        command.append(self.prefix_argument)
+
+                    self.run(command, 'make')
+                    self.install_dynamic()
+                    Make.build(self)
         else:
             Make.build(self)
 
@@ -1132,69 +1526,14 @@ class LibDeflate(Make):
         if not self.node['installed']:
             self.build()
             if self.package_url is not None:
-                static_library_path = os.path.join(self.package_url, 'libdeflate.a')
-                self.log.debug('copying %s to %s', static_library_path, self.lib_prefix)
-                command = [ 'rsync', '--copy-links', static_library_path, self.lib_prefix ]
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('rsync returned {}'.format(code))
-
-                library_header_path = os.path.join(self.package_url, 'libdeflate.h')
-                self.log.debug('copying %s to %s', library_header_path, self.include_prefix)
-                command = [ 'rsync', '--copy-links', library_header_path, self.include_prefix ]
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('rsync returned {}'.format(code))
-
+                library = [ 'libdeflate.a' ]
                 if self.platform == 'Linux':
-                    dynamic_library_path = os.path.join(self.package_url, 'libdeflate.so')
-                    self.log.debug('copying %s to %s', dynamic_library_path, self.lib_prefix)
-                    command = [ 'rsync', '--copy-links', dynamic_library_path, self.lib_prefix ]
-                    process = Popen(
-                        args=command,
-                        env=self.env,
-                        cwd=self.package_url,
-                        stdout=PIPE,
-                        stderr=PIPE
-                    )
-                    output, error = process.communicate()
-                    code = process.returncode
-                    if code == 0:
-                        self.stdout.write(output.decode('utf8'))
-                        self.stderr.write(error.decode('utf8'))
-                    else:
-                        print(code)
-                        print(output.decode('utf8'))
-                        print(error.decode('utf8'))
-                        raise CommandFailedError('rsync returned {}'.format(code))
+                    library.append('libdeflate.so')
+
+                for basename in library:
+                    copy_file(os.path.join(self.package_url, basename), os.path.join(self.lib_prefix, basename), self.log)
+
+                copy_file(os.path.join(self.package_url, 'libdeflate.h'), os.path.join(self.include_prefix, 'libdeflate.h'), self.log)
 
                 self.node['installed'] = True
 
@@ -1206,26 +1545,8 @@ class RapidJSON(Package):
         if not self.node['installed']:
             self.build()
             if self.package_url is not None:
-                self.log.debug('copying %s header files to %s', self.display_name, self.include_prefix)
-                command = [ 'rsync' , '--recursive', os.path.join(self.package_url, 'include/'), self.include_prefix ]
-                process = Popen(
-                    args=command,
-                    env=self.env,
-                    cwd=self.package_url,
-                    stdout=PIPE,
-                    stderr=PIPE
-                )
-                output, error = process.communicate()
-                code = process.returncode
-                if code == 0:
-                    self.node['installed'] = True
-                    self.stdout.write(output.decode('utf8'))
-                    self.stderr.write(error.decode('utf8'))
-                else:
-                    print(code)
-                    print(output.decode('utf8'))
-                    print(error.decode('utf8'))
-                    raise CommandFailedError('rsync returned {}'.format(code))
+                copy_directory(os.path.join(self.package_url, 'include'), self.include_prefix, self.log)
+                self.node['installed'] = True
 
 class SAMTools(Make):
     def __init__(self, pipeline, node):
@@ -1234,12 +1555,21 @@ class SAMTools(Make):
 
 class PackageManager(object):
     def __init__(self, ontology):
+        import platform
+
         self.log = logging.getLogger('PackageManager')
         self.package = None
         self.cache = None
         self.stdout = None
         self.stderr = None
         self.stack = {}
+        self.downloaded = set()
+        self.extracted = set()
+        self.download_lock = threading.Lock()
+        self.archive_locks = {}
+        self.cache_lock = threading.Lock()
+        self.install_count_lock = threading.Lock()
+        self.active_installs = 0
         default = {
             'instruction': {
                 'home': '~/.pheniqs',
@@ -1248,7 +1578,7 @@ class PackageManager(object):
             },
         }
         self.ontology = merge(default, ontology)
-        self.instruction['home'] = os.path.realpath(os.path.abspath(os.path.expanduser(os.path.expandvars(self.instruction['home']))))
+        self.instruction['home'] = expand_path(self.instruction['home'], resolve=True)
         if 'verbosity' in self.instruction and self.instruction['verbosity']:
             self.log.setLevel(log_levels[self.instruction['verbosity']])
 
@@ -1269,26 +1599,51 @@ class PackageManager(object):
         return self.instruction['platform']
 
     def load_cache(self):
+        import json
+
         if 'cache path' in self.instruction:
             if os.path.exists(self.cache_path):
                 with io.open(self.cache_path, 'rb') as file:
-                    self.cache = json.loads(file.read().decode('utf8'))
+                    self.cache = json.load(file)
+
+                # environments are keyed by digests that change with the schema
+                if 'schema' not in self.cache or self.cache['schema'] != cache_schema:
+                    self.log.info('discarding cache with an older schema')
+                    self.cache = None
 
             if self.cache is None:
                 self.cache = {
                     'environment': {},
                     'created': str(datetime.now()),
+                    'schema': cache_schema,
                 }
 
             self.cache['loaded'] = str(datetime.now())
 
     def save_cache(self):
-        if 'cache path' in self.ontology:
-            self.log.debug('persisting cache')
-            with io.open(self.cache_path, 'wb') as file:
-                self.cache['saved'] = str(datetime.now())
-                content = json.dumps(self.cache, sort_keys=True, ensure_ascii=False, indent=4).encode('utf8')
-                file.write(content)
+        import json
+
+        if (
+            'cache path' in self.instruction and
+            self.cache is not None and
+            os.path.isdir(os.path.dirname(self.cache_path))
+        ):
+            with self.cache_lock:
+                self.log.debug('persisting cache')
+                # write a sibling file and rename it so an interrupted save never truncates the cache
+                temporary = '{}.tmp'.format(self.cache_path)
+                if os.path.lexists(temporary):
+                    os.remove(temporary)
+                descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with io.open(descriptor, 'wb') as file:
+                    self.cache['saved'] = str(datetime.now())
+                    content = json.dumps(self.cache, sort_keys=True, ensure_ascii=False).encode('utf8')
+                    file.write(content)
+                os.replace(temporary, self.cache_path)
+
+    @property
+    def trust_cache(self):
+        return 'trust cache' in self.instruction and self.instruction['trust cache']
 
     @property
     def package_implementation(self):
@@ -1322,15 +1677,177 @@ class PackageManager(object):
     def lib_prefix(self):
         return self.instruction['lib prefix']
 
+    def archive_lock(self, url):
+        with self.download_lock:
+            if url not in self.archive_locks:
+                self.archive_locks[url] = threading.RLock()
+            return self.archive_locks[url]
+
+    def archive_downloaded(self, key):
+        with self.download_lock:
+            return key in self.downloaded
+
+    def set_archive_downloaded(self, key):
+        with self.download_lock:
+            self.downloaded.add(key)
+
+    def archive_extracted(self, key):
+        with self.download_lock:
+            return key in self.extracted
+
+    def set_archive_extracted(self, key):
+        with self.download_lock:
+            self.extracted.add(key)
+
+    def verify_all(self, packages):
+        # one sha1sum process checks every cached archive instead of hashing them one by one
+        executable = shutil.which('sha1sum')
+        if executable is not None:
+            from subprocess import Popen, PIPE
+
+            cached = []
+            for package in packages:
+                if (
+                    package.download_url is not None and
+                    package.sha1 is not None and
+                    not package.downloaded and
+                    '\n' not in package.download_url and
+                    '\\' not in package.download_url and
+                    os.path.exists(package.download_url)
+                ):
+                    if self.trust_cache and package.checksum_cached:
+                        package.set_downloaded()
+                    else:
+                        cached.append(package)
+
+            if cached:
+                self.log.debug('verifying %d cached archives', len(cached))
+                check_list = ''.join([ '{}  {}\n'.format(package.sha1, package.download_url) for package in cached ])
+                process = Popen(
+                    args=[ executable, '--check', '--quiet' ],
+                    stdin=PIPE,
+                    stdout=PIPE,
+                    stderr=PIPE
+                )
+                output, error = process.communicate(check_list.encode('utf8'))
+
+                # --quiet only reports the archives that failed, every other listed archive passed
+                failed = set()
+                if process.returncode != 0:
+                    for line in output.decode('utf8').splitlines():
+                        if ': FAILED' in line:
+                            failed.add(line[:line.rfind(': FAILED')])
+
+                # a failure without a parsable report leaves every archive to be hashed again in python
+                if process.returncode == 0 or failed:
+                    for package in cached:
+                        if package.download_url in failed:
+                            self.log.warning('removing corrupt archive %s', package.download_url)
+                            if os.path.exists(package.download_url):
+                                os.remove(package.download_url)
+                            package.remove_checksum_cache()
+
+                        else:
+                            package.set_downloaded()
+                            package.save_checksum_cache()
+
+    def unpack_all(self, packages):
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if packages:
+            with ThreadPoolExecutor(max_workers=min(8, len(packages))) as executor:
+                pending = { executor.submit(package.unpack): package for package in packages }
+                try:
+                    for future in as_completed(pending):
+                        package = pending[future]
+                        status = future.result()
+                        if status == 'streamed':
+                            self.log.info('downloaded and unpacked %s %s', package.display_name, package.sha1)
+                        elif status == 'downloaded':
+                            self.log.info('downloaded archive saved %s %s', package.display_name, package.sha1)
+                            self.log.info('unpacked %s', package.display_name)
+                        elif status == 'unpacked':
+                            self.log.info('unpacked %s', package.display_name)
+                except BaseException:
+                    for future in pending:
+                        future.cancel()
+                    raise
+
+    @property
+    def job_budget(self):
+        # cores are shared between the packages installing at the same time
+        with self.install_count_lock:
+            return max(1, (os.cpu_count() or 2) // max(1, self.active_installs))
+
+    def install_package(self, package):
+        # concurrent callers wait for the first install instead of repeating it
+        with package.install_lock:
+            if not package.installed:
+                with self.install_count_lock:
+                    self.active_installs += 1
+                try:
+                    package.install()
+                finally:
+                    with self.install_count_lock:
+                        self.active_installs -= 1
+            else:
+                self.log.info('%s is already installed', package.display_name)
+
+    def install_all(self, packages):
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+        # a package without a dependency list waits for every package listed before it
+        dependent = { package.name: [] for package in packages }
+        degree = {}
+        for index, package in enumerate(packages):
+            if package.depends_on is None:
+                requirement = [ other.name for other in packages[:index] ]
+            else:
+                requirement = [ name for name in package.depends_on if name in dependent ]
+
+            degree[package.name] = len(requirement)
+            for name in requirement:
+                dependent[name].append(package)
+
+        completed = 0
+        if packages:
+            with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 2, len(packages))) as executor:
+                running = {}
+                for package in packages:
+                    if degree[package.name] == 0:
+                        running[executor.submit(self.install_package, package)] = package
+                try:
+                    while running:
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            package = running.pop(future)
+                            future.result()
+                            completed += 1
+                            for other in dependent[package.name]:
+                                degree[other.name] -= 1
+                                if degree[other.name] == 0:
+                                    running[executor.submit(self.install_package, other)] = other
+                except BaseException:
+                    for future in running:
+                        future.cancel()
+                    raise
+
+        if completed < len(packages):
+            blocked = [ package.display_name for package in packages if degree[package.name] > 0 ]
+            raise CommandFailedError('unresolved dependencies for {}'.format(', '.join(blocked)))
+
     def execute(self):
+        import json
+        import platform
+
         preset = None
         if 'path' in self.instruction:
-            resolved = os.path.abspath(os.path.realpath(os.path.expanduser(os.path.expandvars(self.instruction['path']))))
+            resolved = expand_path(self.instruction['path'], resolve=True)
             if os.path.exists(resolved):
                 self.log.debug('loading %s', self.instruction['path'])
                 with io.open(resolved, 'rb') as file:
-                    preset = json.loads(file.read().decode('utf8'))
-                    preset['document sha1 digest'] = hashlib.sha1(resolved.encode('utf8')).hexdigest()
+                    preset = json.load(file)
+                    preset['document digest'] = fast_digest(resolved)
             else:
                 raise CommandFailedError('failed to open {}'.format(self.instruction['path']))
 
@@ -1349,7 +1866,7 @@ class PackageManager(object):
                         package['remote filename'] = 'pheniqs-{}.zip'.format(revision)
                         package['remote url'] = '{}/zip/{}'.format(self.ontology['pheniqs code url prefix'], revision)
                         package['version'] = 'git-{}'.format(revision)
-                preset['document sha1 digest'] = hashlib.sha1(name.encode('utf8')).hexdigest()
+                preset['document digest'] = fast_digest(name)
             else:
                 raise CommandFailedError('preset {} does not exist'.format(self.instruction['preset']))
         else:
@@ -1375,28 +1892,50 @@ class PackageManager(object):
         if not preset['install prefix']:  preset['install prefix'] =    os.path.join(preset['home'], 'install')
         if not preset['download prefix']: preset['download prefix'] =   os.path.join(preset['home'], 'download')
         if not preset['package prefix']:  preset['package prefix'] =    os.path.join(preset['home'], 'package')
+
+        # symlinks only need resolving where the path ends up in compiler and install flags.
+        # the bin, include and lib prefixes derive from the resolved install prefix so
+        # --prefix, CFLAGS and LDFLAGS all name the same real directory
+        for path in [
+            'home',
+            'install prefix',
+        ]:
+            preset[path] = expand_path(preset[path], resolve=True)
+
         if not preset['bin prefix']:      preset['bin prefix'] =        os.path.join(preset['install prefix'], 'bin')
         if not preset['include prefix']:  preset['include prefix'] =    os.path.join(preset['install prefix'], 'include')
         if not preset['lib prefix']:      preset['lib prefix'] =        os.path.join(preset['install prefix'], 'lib')
 
         for path in [
-            'home',
             'cache path',
-            'install prefix',
             'download prefix',
             'package prefix',
             'bin prefix',
             'include prefix',
             'lib prefix',
         ]:
-            preset[path] = os.path.abspath(os.path.expanduser(os.path.expandvars(preset[path])))
+            preset[path] = expand_path(preset[path])
 
         self.ontology['instruction'] = merge(self.instruction, preset)
         self.load_cache()
-        if self.instruction['document sha1 digest'] not in self.cache['environment']:
-            self.cache['environment'][self.instruction['document sha1 digest']] = { 'package': {} }
-
-        self.persisted_instruction = self.cache['environment'][self.instruction['document sha1 digest']]
+        if self.instruction['document digest'] not in self.cache['environment']:
+            self.cache['environment'][self.instruction['document digest']] = { 'package': {} }
+
+        self.persisted_instruction = self.cache['environment'][self.instruction['document digest']]
+
+        # nothing changed since the last complete build, skip creating and checking every package
+        # stale nodes from an older package list stay in the cache so only the recorded nodes of this list are checked
+        installed_digest = document_digest(self.instruction['package'])
+        persisted = self.persisted_instruction['package']
+        if (
+            self.action == 'build' and
+            'installed digest' in self.persisted_instruction and
+            'installed package' in self.persisted_instruction and
+            self.persisted_instruction['installed digest'] == installed_digest and
+            all([ digest in persisted and persisted[digest]['installed'] for digest in self.persisted_instruction['installed package'] ])
+        ):
+            self.log.info('all packages are already installed')
+            return
 
         if self.instruction['package']:
             self.stack['package'] = []
@@ -1404,8 +1943,9 @@ class PackageManager(object):
             prepare_directory(self.install_prefix, self.log)
             prepare_directory(self.download_prefix, self.log)
             prepare_directory(self.package_prefix, self.log)
-            self.stdout = io.open(os.path.join(self.home, 'output'), 'a')
-            self.stderr = io.open(os.path.join(self.home, 'error'), 'a')
+            # unbuffered binary logs, commands write to the same descriptors so nothing needs flushing
+            self.stdout = io.open(os.path.join(self.home, 'output'), 'ab', buffering=0)
+            self.stderr = io.open(os.path.join(self.home, 'error'), 'ab', buffering=0)
 
             for o in self.instruction['package']:
                 key = o['name']
@@ -1415,22 +1955,26 @@ class PackageManager(object):
                 package = Package.create(self, o)
                 if package:
                     self.stack['package'].append(package)
+
+            if self.action == 'build':
+                pending = [ package for package in self.stack['package'] if not package.unpacked ]
+                self.verify_all(pending)
+                self.unpack_all(pending)
+
+                self.install_all(self.stack['package'])
+                self.persisted_instruction['installed digest'] = installed_digest
+                self.persisted_instruction['installed package'] = [ package.node['document digest'] for package in self.stack['package'] ]
+
+            else:
+                for package in self.stack['package']:
                     if self.action == 'clean':
                         self.log.info('cleaning %s', package.display_name)
                         package.clean()
 
-                    elif self.action == 'build':
-                        if not package.installed:
-                            package.install()
-                        else:
-                            self.log.info('%s is already installed', package.display_name)
-
                     elif self.action == 'clean.package':
                         self.log.info('clearing %s', package.display_name)
                         package.clean_package()
 
-                    self.save_cache()
-
     def close(self):
         self.save_cache()
 
@@ -1439,8 +1983,6 @@ class PackageManager(object):
         if self.stderr:
             self.stderr.close();
 
-        Job.close(self)
-
 def main():
     logging.basicConfig()
     logging.getLogger().setLevel(logging.INFO)
@@ -1455,8 +1997,8 @@ def main():
             if 'verbosity' in command.instruction and command.instruction['verbosity']:
                 logging.getLogger().setLevel(log_levels[command.instruction['verbosity']])
 
-            job = PackageManager(command.configuration)
-            job.execute()
+            pipeline = PackageManager(command.configuration)
+            pipeline.execute()
 
     except (
         DownloadError,